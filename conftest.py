@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+# Habilita el fixture escpos_printer (simulador_pytest) para las pruebas del repositorio
+pytest_plugins = ["simulador_pytest"]
@@ -0,0 +1,1391 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Núcleo del simulador de impresora ESC/POS, sin dependencias de Qt: parser,
+almacenes de gráficos, renderizado de tickets, índice de búsqueda, emulación de
+velocidad y servidor TCP. Además expone HeadlessPrinter, una API embebible para
+usar el simulador dentro de otros programas o suites de prueba.
+"""
+
+import os
+import re
+import sys
+import json
+import queue
+import bisect
+import argparse
+import socket
+import threading
+import io
+import time
+import hashlib
+from collections import OrderedDict, deque
+from datetime import datetime
+from PIL import Image, ImageDraw, ImageFont
+import qrcode
+import barcode
+from barcode.writer import ImageWriter
+
+
+def _decode_raster(data, width, height):
+    """
+    Decodifica un bloque de bits en formato raster (fila por fila, MSB a la izquierda,
+    1 = punto negro) a un PIL.Image en modo "L".
+    """
+    row_bytes = (width + 7) // 8
+    img = Image.frombytes("1", (row_bytes * 8, height), bytes(data), "raw", "1;I")
+    if img.width != width:
+        img = img.crop((0, 0, width, height))
+    return img.convert("L")
+
+
+def _decode_columns(data, width, height):
+    """
+    Decodifica un bloque de bits en formato columna (columna por columna, MSB arriba,
+    1 = punto negro), como el que usan ESC *, FS q y GS ( L en formato columna.
+    """
+    col_bytes = (height + 7) // 8
+    # Cada columna es una "fila" de la imagen traspuesta
+    img = Image.frombytes("1", (col_bytes * 8, width), bytes(data), "raw", "1;I")
+    img = img.transpose(Image.TRANSPOSE)
+    if img.height != height:
+        img = img.crop((0, 0, width, height))
+    return img.convert("L")
+
+
+class NVGraphicsStore:
+    """
+    Almacén de gráficos definidos en la impresora (GS ( L, FS q), indexados por clave.
+    Las imágenes se guardan ya decodificadas, de modo que imprimirlas por clave no
+    vuelve a procesar los bits. Si se indica storage_dir, cada imagen se persiste
+    como PNG y se recarga al iniciar (como la memoria NV de una impresora real).
+    """
+
+    def __init__(self, storage_dir=None):
+        self.storage_dir = storage_dir
+        self._images = {}
+        # Variantes escaladas ya calculadas: (clave, escala_x, escala_y) -> imagen
+        self._scaled = {}
+        if self.storage_dir:
+            self._load()
+
+    def _path_for(self, key):
+        return os.path.join(self.storage_dir, key.encode("utf-8").hex() + ".png")
+
+    def _load(self):
+        """Carga las imágenes persistidas en storage_dir (si existe)."""
+        if not os.path.isdir(self.storage_dir):
+            return
+        for name in os.listdir(self.storage_dir):
+            if not name.endswith(".png"):
+                continue
+            try:
+                key = bytes.fromhex(name[:-4]).decode("utf-8")
+                with Image.open(os.path.join(self.storage_dir, name)) as img:
+                    self._images[key] = img.convert("L")
+            except Exception:
+                continue
+
+    def define(self, key, image):
+        """Guarda (o reemplaza) la imagen asociada a key."""
+        self._images[key] = image
+        self._scaled = {k: v for k, v in self._scaled.items() if k[0] != key}
+        if self.storage_dir:
+            os.makedirs(self.storage_dir, exist_ok=True)
+            image.save(self._path_for(key), "PNG")
+
+    def get(self, key, scale_x=1, scale_y=1):
+        """Devuelve la imagen de key (escalada si corresponde) o None si no existe."""
+        img = self._images.get(key)
+        if img is None or (scale_x, scale_y) == (1, 1):
+            return img
+        cache_key = (key, scale_x, scale_y)
+        if cache_key not in self._scaled:
+            self._scaled[cache_key] = img.resize(
+                (img.width * scale_x, img.height * scale_y), Image.NEAREST
+            )
+        return self._scaled[cache_key]
+
+    def delete(self, key):
+        """Elimina la imagen de key (si existe)."""
+        self._images.pop(key, None)
+        self._scaled = {k: v for k, v in self._scaled.items() if k[0] != key}
+        if self.storage_dir and os.path.exists(self._path_for(key)):
+            os.remove(self._path_for(key))
+
+    def clear(self):
+        """Elimina todas las imágenes del almacén."""
+        for key in list(self._images):
+            self.delete(key)
+
+    def keys(self):
+        return list(self._images)
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def __len__(self):
+        return len(self._images)
+
+
+# Fuentes usadas para renderizar texto (forman parte de la clave de la caché de render)
+FONT_REGULAR = "DejaVuSans.ttf"
+FONT_BOLD = "DejaVuSans-Bold.ttf"
+
+
+class RenderCache:
+    """
+    Caché LRU acotada de imágenes renderizadas, direccionada por contenido (clave = hash).
+    Se limita por cantidad de entradas y por bytes de imagen (modo "L" = 1 byte por píxel),
+    y lleva la cuenta de aciertos, fallos y desalojos.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Devuelve la imagen de key (marcándola como usada) o None si no está."""
+        img = self._entries.get(key)
+        if img is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return img
+
+    def put(self, key, img):
+        """Guarda img bajo key y desaloja las entradas menos usadas si se supera el límite."""
+        if key in self._entries:
+            self.size_bytes -= self._image_bytes(self._entries.pop(key))
+        self._entries[key] = img
+        self.size_bytes += self._image_bytes(img)
+        while self._entries and (len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self.size_bytes -= self._image_bytes(old)
+            self.evictions += 1
+
+    def clear(self):
+        """Vacía la caché (las estadísticas se conservan)."""
+        self._entries.clear()
+        self.size_bytes = 0
+
+    @staticmethod
+    def _image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Resumen de uso de la caché."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _element_digest(el):
+    """Devuelve un hash estable del contenido de un elemento del ticket."""
+    hasher = hashlib.sha256()
+    tipo = el[0]
+    hasher.update(tipo.encode("ascii") + b"\0")
+    if tipo == "text":
+        hasher.update(el[1].encode("utf-8") + b"\0")
+        hasher.update(repr(sorted(el[2].items())).encode("utf-8"))
+    elif tipo in ("qr", "barcode"):
+        hasher.update(el[1].encode("utf-8"))
+    elif tipo == "image":
+        hasher.update(f"{el[1].mode}{el[1].size}".encode("ascii"))
+        hasher.update(el[1].tobytes())
+    elif tipo == "feed":
+        hasher.update(str(el[1]).encode("ascii"))
+    return hasher.hexdigest()
+
+
+class TicketIndex:
+    """
+    Índice invertido sobre el contenido de los tickets impresos (texto, QR y códigos
+    de barras), con ID de ticket, conexión de origen y marca de tiempo por registro.
+    Las búsquedas usan prefijos de palabra y exigen que aparezcan todas las palabras.
+    Si se indica index_path, cada ticket se agrega además a ese archivo JSON Lines,
+    que luego puede consultarse sin interfaz gráfica (ver --buscar). Los IDs
+    continúan desde el mayor ID del archivo, así que no se repiten entre sesiones.
+    """
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.records = {}
+        self.next_id = 1
+        self._postings = {}
+        self._vocabulary = []  # palabras ordenadas, para buscar por prefijo
+        self._lock = threading.Lock()
+        if index_path and os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.next_id = max(self.next_id, json.loads(line)["id"] + 1)
+
+    @staticmethod
+    def _tokenize(text):
+        return re.findall(r"\w+", text.lower())
+
+    def _insert(self, record):
+        self.records[record["id"]] = record
+        self.next_id = max(self.next_id, record["id"] + 1)
+        for token in set(self._tokenize(" ".join(record["texts"]))):
+            if token not in self._postings:
+                self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+            self._postings[token].add(record["id"])
+
+    def add(self, elements, connection=None, timestamp=None):
+        """
+        Indexa los elementos de texto, QR y código de barras de un ticket y
+        devuelve su registro (con el ID asignado).
+        """
+        record = {
+            "connection": connection,
+            "timestamp": (timestamp or datetime.now()).isoformat(timespec="seconds"),
+            "texts": [el[1] for el in elements if el[0] in ("text", "qr", "barcode")],
+        }
+        with self._lock:
+            record["id"] = self.next_id
+            self._insert(record)
+            if self.index_path:
+                with open(self.index_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def search(self, query, connection=None, since=None, until=None):
+        """
+        Devuelve los registros (ordenados por ID) que contienen todas las palabras
+        de query, filtrando opcionalmente por conexión y rango de fechas ISO.
+        """
+        since = self._parse_bound(since, end=False) if since else None
+        until = self._parse_bound(until, end=True) if until else None
+        tokens = self._tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            result = None
+            for token in tokens:
+                ids = set()
+                pos = bisect.bisect_left(self._vocabulary, token)
+                while pos < len(self._vocabulary) and self._vocabulary[pos].startswith(token):
+                    ids |= self._postings[self._vocabulary[pos]]
+                    pos += 1
+                result = ids if result is None else result & ids
+                if not result:
+                    return []
+            records = [self.records[ticket_id] for ticket_id in sorted(result)]
+        if connection:
+            records = [r for r in records if self._connection_matches(r["connection"], connection)]
+        if since:
+            records = [r for r in records if datetime.fromisoformat(r["timestamp"]) >= since]
+        if until:
+            records = [r for r in records if datetime.fromisoformat(r["timestamp"]) <= until]
+        return records
+
+    @staticmethod
+    def _connection_matches(record_connection, connection):
+        """Compara "ip:puerto" exacto, o solo la IP si el filtro no indica puerto."""
+        if not record_connection:
+            return False
+        if ":" in connection:
+            return record_connection == connection
+        return record_connection.rsplit(":", 1)[0] == connection
+
+    @staticmethod
+    def _parse_bound(value, end):
+        """
+        Convierte un límite ISO (fecha o fecha/hora local) a datetime. Una fecha sin
+        hora usada como límite superior abarca todo ese día. Las marcas de tiempo se
+        guardan en hora local sin zona, así que no se aceptan límites con zona horaria.
+        """
+        bound = datetime.fromisoformat(value)
+        if bound.tzinfo is not None:
+            raise ValueError(f"no se admite zona horaria en '{value}' (usar hora local)")
+        if end and "T" not in value and " " not in value.strip():
+            bound = bound.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return bound
+
+    @classmethod
+    def load(cls, index_path):
+        """Carga un índice guardado en JSON Lines (para consultas sin interfaz)."""
+        index = cls()
+        with open(index_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    index._insert(json.loads(line))
+        return index
+
+    def clear(self):
+        """Vacía el índice en memoria (el archivo JSON Lines y la numeración se conservan)."""
+        with self._lock:
+            self.records.clear()
+            self._postings.clear()
+            self._vocabulary.clear()
+
+    def __len__(self):
+        return len(self.records)
+
+
+class ESC_POS_Parser:
+    def __init__(self, on_render, on_log, nv_storage_dir=None):
+        self.buffer = bytearray()
+        self.on_render = on_render
+        self.on_log = on_log
+        self.objects = []
+        self.style = {
+            "bold": False,
+            "underline": False,
+            "align": "left",
+            "text_size": (1, 1)
+        }
+        self.state = "NORMAL"
+        self.log_enabled = True
+
+        # Ancho fijo del ticket
+        self.paper_width = 400
+        self.print_width = None  # definido pero no se emplea
+
+        # Flag para ignorar texto imprimible hasta encontrar un LF
+        self.skip_text_until_lf = False
+
+        # Gráficos almacenados en la impresora: NV (GS ( L y FS q, opcionalmente
+        # persistidos en disco) y de descarga (GS ( L, solo en memoria)
+        self.nv_graphics = NVGraphicsStore(
+            os.path.join(nv_storage_dir, "gs_l") if nv_storage_dir else None
+        )
+        self.nv_bit_images = NVGraphicsStore(
+            os.path.join(nv_storage_dir, "fs_q") if nv_storage_dir else None
+        )
+        self.download_graphics = NVGraphicsStore()
+        # Gráfico guardado en el buffer de impresión (GS ( L fn 112/113, se imprime con fn 50)
+        self.print_buffer_graphic = None
+
+    def feed(self, data: bytes):
+        """Agrega nuevos bytes al buffer y los procesa."""
+        self.buffer.extend(data)
+        self._process()
+
+    def _log_command(self, cmd_name, data=None):
+        """Registra en el log los comandos ESC/POS que se van recibiendo."""
+        if self.log_enabled:
+            hex_data = " ".join(f"{b:02X}" for b in data) if data else ""
+            if "UNKNOWN" in cmd_name:
+                self.on_log(f"[CMD] {cmd_name.ljust(15)} {hex_data} - Bytes: {len(data) if data else 0}")
+            else:
+                self.on_log(f"[CMD] {cmd_name.ljust(15)} {hex_data}")
+
+    def _process(self):
+        """
+        Recorre el buffer y:
+         - Reconoce texto ASCII, saltos de línea, imágenes, barras, QR, comandos ESC/POS, etc.
+         - Cuando identifica un objeto, lo agrega a self.objects.
+         - Si llega a “cut” (GS V), en lugar de añadir texto “B”, genera un objeto ("cut", None).
+         - Al final, llama a on_render(self.objects) y descarta los bytes procesados.
+        """
+        i = 0
+        current_text = ""
+
+        while i < len(self.buffer):
+            b = self.buffer[i]
+
+            # ----------------------- ESTADO NORMAL ------------------------------
+            if self.state == "NORMAL":
+
+                # 1) Si estamos ignorando texto hasta LF, descartamos bytes imprimibles
+                if self.skip_text_until_lf:
+                    if b == 0x0A:  # saltó la línea
+                        # Procesar ese LF como si fuera un salto normal
+                        if current_text.strip():
+                            self.objects.append(("text", current_text.strip(), self.style.copy()))
+                        current_text = ""
+                        self.skip_text_until_lf = False
+                        i += 1
+                        continue
+                    else:
+                        # Cualquier otro byte simplemente se descarta
+                        i += 1
+                        continue
+
+                # 2) LF = 0x0A → salto de línea
+                if b == 0x0A:
+                    if current_text.strip():
+                        self.objects.append(("text", current_text.strip(), self.style.copy()))
+                    current_text = ""
+                    i += 1
+                    continue
+
+                # GS / FS al final del buffer: esperar más bytes antes de decidir qué comando es
+                if b in (0x1C, 0x1D) and i + 2 >= len(self.buffer):
+                    break
+
+                # 3) Detectar QR (GS ( k)
+                if b == 0x1D and i + 2 < len(self.buffer) and self.buffer[i + 1] == 0x28 and self.buffer[i + 2] == 0x6B:
+                    try:
+                        # Leer longitud
+                        if i + 8 < len(self.buffer):
+                            size = self.buffer[i + 7]
+                            j = i + 8
+                            if j + size <= len(self.buffer):
+                                qr_data = self.buffer[j : j + size].decode("utf-8", errors="ignore")
+                                self.objects.append(("qr", qr_data))
+                                current_text = ""
+                                # A partir de aquí, ignorar texto hasta el próximo LF
+                                self.skip_text_until_lf = True
+                                i = j + size
+                                continue
+                    except:
+                        pass
+                    # Si falla, avanzamos un byte
+                    i += 1
+                    continue
+
+                # 4) Detectar CÓDIGO DE BARRAS (GS k)
+                if b == 0x1D and i + 1 < len(self.buffer) and self.buffer[i + 1] == 0x6B:
+                    j = i + 3
+                    while j < len(self.buffer) and self.buffer[j] != 0x00:
+                        j += 1
+                    data = self.buffer[i + 3 : j].decode("ascii", errors="ignore")
+                    self.objects.append(("barcode", data))
+                    i = j + 1
+                    continue
+
+                # 5) Detectar IMAGEN (GS v 0)
+                if b == 0x1D and self.buffer[i + 1] == 0x76 and i + 7 >= len(self.buffer):
+                    break  # aún no llegó la cabecera completa (GS v 0 m xL xH yL yH)
+                if b == 0x1D and i + 7 < len(self.buffer) and self.buffer[i + 1] == 0x76:
+                    width_bytes = self.buffer[i + 4] + self.buffer[i + 5] * 256
+                    img_height = self.buffer[i + 6] + self.buffer[i + 7] * 256
+                    data_start = i + 8
+                    data_end = data_start + width_bytes * img_height
+                    if data_end <= len(self.buffer):
+                        raw_image = self.buffer[data_start:data_end]
+                        self.objects.append(("image", _decode_raster(raw_image, width_bytes * 8, img_height)))
+                        i = data_end
+                        continue
+                    else:
+                        break  # aún no llegó todo el bloque de bits
+
+                # 5b) Gráficos NV / de descarga (GS ( L  y  GS 8 L)
+                if b == 0x1D and i + 2 < len(self.buffer) and self.buffer[i + 2] == 0x4C and self.buffer[i + 1] in (0x28, 0x38):
+                    if self.buffer[i + 1] == 0x28:
+                        header = 5  # GS ( L pL pH
+                        if i + header > len(self.buffer):
+                            break
+                        length = self.buffer[i + 3] + self.buffer[i + 4] * 256
+                    else:
+                        header = 7  # GS 8 L p1 p2 p3 p4
+                        if i + header > len(self.buffer):
+                            break
+                        length = int.from_bytes(self.buffer[i + 3 : i + 7], "little")
+                    block_end = i + header + length
+                    if block_end > len(self.buffer):
+                        break  # aún no llegó todo el bloque de datos
+                    if current_text.strip():
+                        self.objects.append(("text", current_text.strip(), self.style.copy()))
+                    current_text = ""
+                    self._handle_graphics(self.buffer[i + header : block_end], self.buffer[i : i + header])
+                    i = block_end
+                    continue
+
+                # 5c) Imágenes de bits NV (FS q = definir, FS p = imprimir)
+                if b == 0x1C and i + 1 < len(self.buffer) and self.buffer[i + 1] in (0x70, 0x71):
+                    if self.buffer[i + 1] == 0x70:
+                        if i + 3 >= len(self.buffer):
+                            break
+                        n, m = self.buffer[i + 2], self.buffer[i + 3]
+                        if current_text.strip():
+                            self.objects.append(("text", current_text.strip(), self.style.copy()))
+                        current_text = ""
+                        self._log_command("FS p", self.buffer[i : i + 4])
+                        scale_x = 2 if m in (1, 3) else 1
+                        scale_y = 2 if m in (2, 3) else 1
+                        img = self.nv_bit_images.get(str(n), scale_x, scale_y)
+                        if img is not None:
+                            self.objects.append(("image", img))
+                        else:
+                            self.on_log(f"[NV] Imagen de bits NV {n} no definida")
+                        i += 4
+                        continue
+
+                    # FS q n [xL xH yL yH d1...dk]1 ... [xL xH yL yH d1...dk]n
+                    if i + 2 >= len(self.buffer):
+                        break
+                    count = self.buffer[i + 2]
+                    j = i + 3
+                    definitions = []
+                    for _ in range(count):
+                        if j + 4 > len(self.buffer):
+                            break
+                        x = self.buffer[j] + self.buffer[j + 1] * 256
+                        y = self.buffer[j + 2] + self.buffer[j + 3] * 256
+                        data_end = j + 4 + x * y * 8
+                        if data_end > len(self.buffer):
+                            break
+                        definitions.append((x * 8, y * 8, j + 4, data_end))
+                        j = data_end
+                    if len(definitions) < count:
+                        break  # aún no llegaron todas las imágenes
+                    self._log_command("FS q", self.buffer[i : i + 3])
+                    # FS q reemplaza todas las imágenes de bits NV anteriores
+                    self.nv_bit_images.clear()
+                    for number, (img_width, img_height, data_start, data_end) in enumerate(definitions, 1):
+                        self.nv_bit_images.define(
+                            str(number),
+                            _decode_columns(self.buffer[data_start:data_end], img_width, img_height)
+                        )
+                    i = j
+                    continue
+
+                # 6) Texto ASCII imprimible
+                if 32 <= b <= 126:
+                    current_text += chr(b)
+                    i += 1
+                    continue
+
+                # 7) ESC (0x1B)
+                if b == 0x1B:
+                    self.state = "ESC"
+                    i += 1
+                    continue
+                #    GS (0x1D)
+                elif b == 0x1D:
+                    self.state = "GS"
+                    i += 1
+                    continue
+
+                # 8) Cualquier otro byte: avanzamos
+                i += 1
+                continue
+
+            # ------------------------ ESTADO ESC -------------------------------
+            elif self.state == "ESC":
+                cmd = self.buffer[i]
+
+                # 1B 40 = INIT
+                if cmd == 0x40:
+                    self._log_command("INIT", self.buffer[i - 1 : i + 1])
+                    self.state = "NORMAL"
+                    i += 1
+                    continue
+
+                # 1B 45 n = BOLD
+                elif cmd == 0x45 and i + 1 < len(self.buffer):
+                    self.style["bold"] = (self.buffer[i + 1] != 0)
+                    self._log_command("BOLD", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1B 61 n = ALIGN
+                elif cmd == 0x61 and i + 1 < len(self.buffer):
+                    align = self.buffer[i + 1]
+                    opciones = {0: "left", 1: "center", 2: "right"}
+                    self.style["align"] = opciones.get(align, "left")
+                    self._log_command("ALIGN", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1B 64 n = FEED
+                elif cmd == 0x64 and i + 1 < len(self.buffer):
+                    lines = self.buffer[i + 1]
+                    self._log_command("FEED", self.buffer[i - 1 : i + 2])
+                    for _ in range(lines):
+                        if current_text.strip():
+                            self.objects.append(("text", current_text.strip(), self.style.copy()))
+                        current_text = ""
+                        self.objects.append(("feed", 1))
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1B 2D n = UNDERLINE
+                elif cmd == 0x2D and i + 1 < len(self.buffer):
+                    self.style["underline"] = (self.buffer[i + 1] != 0)
+                    self._log_command("UNDERLINE", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1B 2A m nL nH d1...dk = IMAGEN DE BITS (formato columna)
+                elif cmd == 0x2A:
+                    if i + 3 >= len(self.buffer):
+                        break
+                    m = self.buffer[i + 1]
+                    columns = self.buffer[i + 2] + self.buffer[i + 3] * 256
+                    dots = 24 if m in (32, 33) else 8
+                    data_start = i + 4
+                    data_end = data_start + columns * dots // 8
+                    if data_end > len(self.buffer):
+                        break  # aún no llegó todo el bloque de bits
+                    img = _decode_columns(self.buffer[data_start:data_end], columns, dots)
+                    # En densidad simple cada columna ocupa el doble de ancho
+                    if m in (0, 32):
+                        img = img.resize((columns * 2, dots), Image.NEAREST)
+                    self._append_bit_image(img)
+                    self._log_command("BIT IMAGE", b"\x1b" + self.buffer[i : data_start])
+                    self.state = "NORMAL"
+                    i = data_end
+                    continue
+
+                # 1B 33 n = INTERLINEADO (solo registramos)
+                elif cmd == 0x33 and i + 1 < len(self.buffer):
+                    self._log_command("LINE SPACING", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1B 32 = INTERLINEADO POR DEFECTO (solo registramos)
+                elif cmd == 0x32:
+                    self._log_command("LINE SPACING", self.buffer[i - 1 : i + 1])
+                    self.state = "NORMAL"
+                    i += 1
+                    continue
+
+                # 1B 74 n = CODEPAGE (solo registramos)
+                elif cmd == 0x74 and i + 1 < len(self.buffer):
+                    self._log_command("CODEPAGE", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                else:
+                    # ESC desconocido
+                    self._log_command(f"UNKNOWN ESC {cmd:02X}", self.buffer[i - 1 : i + 1])
+                    self.state = "NORMAL"
+                    i += 1
+                    continue
+
+            # ------------------------ ESTADO GS --------------------------------
+            elif self.state == "GS":
+                cmd = self.buffer[i]
+
+                # -- Nuevo bloque: detectar GS W (1D 57) y consumir sus 2 parámetros --
+                if cmd == 0x57 and i + 2 < len(self.buffer):
+                    # Logueamos “GS W” junto con sus 2 bytes de parámetro (por ejemplo 30 02)
+                    self._log_command("GS W", self.buffer[i - 1 : i + 3])
+                    # Avanzar sobretodo para que no caiga 0x30 como texto
+                    i += 3
+                    self.state = "NORMAL"
+                    continue
+
+                # 1D 21 n = TEXT SIZE
+                if cmd == 0x21 and i + 1 < len(self.buffer):
+                    size = self.buffer[i + 1]
+                    width = (size >> 4) + 1
+                    height = (size & 0x0F) + 1
+                    self.style["text_size"] = (width, height)
+                    self._log_command("TEXT SIZE", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                # 1D 56 m = CUT PAPER  <---  aquí detectamos el “cut”
+                elif cmd == 0x56 and i + 1 < len(self.buffer):
+                    m = self.buffer[i + 1]
+                    # Simular el corte: en lugar de dejar caer 'B', creamos un objeto “cut”
+                    self.objects.append(("cut", None))
+                    self._log_command("CUT", self.buffer[i - 1 : i + 2])
+                    self.state = "NORMAL"
+                    i += 2
+                    continue
+
+                else:
+                    # GS desconocido
+                    self._log_command(f"UNKNOWN GS {cmd:02X}", self.buffer[i - 1 : i + 1])
+                    self.state = "NORMAL"
+                    i += 1
+                    continue
+
+        # Si quedó texto pendiente, lo agregamos
+        if current_text.strip():
+            self.objects.append(("text", current_text.strip(), self.style.copy()))
+
+        # Si hay objetos, llamamos al callback para renderizar
+        if self.objects:
+            self.on_render(self.objects)
+            self.objects.clear()
+
+        # Eliminamos los bytes ya procesados del buffer
+        if i > 0:
+            del self.buffer[:i]
+
+    def _append_bit_image(self, img):
+        """
+        Agrega una franja de ESC *. Las franjas consecutivas (una por línea) se unen
+        verticalmente en una sola imagen, como quedarían impresas en el papel.
+        """
+        if self.objects and self.objects[-1][0] == "image" and self.objects[-1][2:] == ("bit_image",):
+            prev = self.objects[-1][1]
+            merged = Image.new("L", (max(prev.width, img.width), prev.height + img.height), 255)
+            merged.paste(prev, (0, 0))
+            merged.paste(img, (0, prev.height))
+            img = merged
+            self.objects.pop()
+        self.objects.append(("image", img, "bit_image"))
+
+    def _decode_graphic_definition(self, params, column_format):
+        """
+        Decodifica los parámetros "a kc1 kc2 b xL xH yL yH c d1...dk" de una
+        definición de gráfico (GS ( L fn 67/68/83/84). Devuelve (clave, imagen).
+        Con varios colores solo se usa el primer plano.
+        """
+        key = bytes(params[3:5]).decode("latin-1")
+        width = params[6] + params[7] * 256
+        height = params[8] + params[9] * 256
+        if column_format:
+            size = width * ((height + 7) // 8)
+            img = _decode_columns(params[11 : 11 + size], width, height)
+        else:
+            size = ((width + 7) // 8) * height
+            img = _decode_raster(params[11 : 11 + size], width, height)
+        return key, img
+
+    def _handle_graphics(self, params, header):
+        """
+        Procesa un bloque GS ( L / GS 8 L (params = m fn ...).
+        Las definiciones se decodifican una sola vez y quedan en el almacén
+        correspondiente; las órdenes de impresión agregan la imagen ya decodificada.
+        """
+        if len(params) < 2:
+            self._log_command("GS ( L", header + params)
+            return
+        fn = params[1]
+        log_data = header + params[:12]
+        try:
+            # fn 67/68 = definir NV (raster/columna), fn 83/84 = definir descarga
+            if fn in (67, 68, 83, 84):
+                key, img = self._decode_graphic_definition(params, column_format=fn in (68, 84))
+                store = self.nv_graphics if fn in (67, 68) else self.download_graphics
+                store.define(key, img)
+                self._log_command("NV DEFINE" if fn in (67, 68) else "DL DEFINE", log_data)
+
+            # fn 69 = imprimir NV, fn 85 = imprimir descarga: kc1 kc2 x y
+            elif fn in (69, 85):
+                key = bytes(params[2:4]).decode("latin-1")
+                scale_x = 2 if params[4] == 2 else 1
+                scale_y = 2 if params[5] == 2 else 1
+                store = self.nv_graphics if fn == 69 else self.download_graphics
+                img = store.get(key, scale_x, scale_y)
+                self._log_command("NV PRINT" if fn == 69 else "DL PRINT", log_data)
+                if img is not None:
+                    self.objects.append(("image", img))
+                else:
+                    self.on_log(f"[NV] Gráfico '{key}' no definido")
+
+            # fn 65/81 = borrar todos, fn 66/82 = borrar por clave
+            elif fn in (65, 81):
+                (self.nv_graphics if fn == 65 else self.download_graphics).clear()
+                self._log_command("NV CLEAR" if fn == 65 else "DL CLEAR", log_data)
+            elif fn in (66, 82):
+                key = bytes(params[2:4]).decode("latin-1")
+                (self.nv_graphics if fn == 66 else self.download_graphics).delete(key)
+                self._log_command("NV DELETE" if fn == 66 else "DL DELETE", log_data)
+
+            # fn 112/113 = guardar en el buffer de impresión: a bx by c xL xH yL yH d1...dk
+            elif fn in (112, 113):
+                scale_x = 2 if params[3] == 2 else 1
+                scale_y = 2 if params[4] == 2 else 1
+                width = params[6] + params[7] * 256
+                height = params[8] + params[9] * 256
+                if fn == 112:
+                    img = _decode_raster(params[10:], width, height)
+                else:
+                    img = _decode_columns(params[10:], width, height)
+                if (scale_x, scale_y) != (1, 1):
+                    img = img.resize((width * scale_x, height * scale_y), Image.NEAREST)
+                self.print_buffer_graphic = img
+                self._log_command("GRAPHIC STORE", log_data)
+
+            # fn 50 = imprimir el gráfico del buffer de impresión
+            elif fn == 50:
+                if self.print_buffer_graphic is not None:
+                    self.objects.append(("image", self.print_buffer_graphic))
+                    self.print_buffer_graphic = None
+                self._log_command("GRAPHIC PRINT", log_data)
+
+            else:
+                self._log_command(f"UNKNOWN GS ( L fn {fn}", log_data)
+        except Exception as e:
+            self.on_log(f"[NV ERROR] {e}")
+
+
+class PrinterEmulation:
+    """
+    Modelo de rendimiento de una impresora térmica real: un único cabezal que imprime
+    a speed_mm_s milímetros por segundo (más cut_time segundos por cada corte) y un
+    buffer de recepción de buffer_size bytes. Los bytes recibidos ocupan el buffer
+    hasta que el cabezal termina de imprimir el trabajo al que pertenecen; con el
+    buffer lleno, TCPServer deja de leer el socket y el cliente recibe backpressure TCP.
+    """
+
+    def __init__(self, speed_mm_s=250.0, buffer_size=4096, cut_time=0.5, print_width_mm=72.0):
+        self.speed_mm_s = speed_mm_s
+        self.buffer_size = buffer_size
+        self.cut_time = cut_time
+        # Ancho imprimible real: convierte los píxeles del ticket renderizado a milímetros
+        self.print_width_mm = print_width_mm
+        self.busy_until = 0.0
+        # Totales acumulados (sin guardar el historial de trabajos, para pruebas largas)
+        self.job_count = 0
+        self.total_print_time = 0.0
+        self.max_queue_bytes = 0
+        self._unfinished = deque()  # instantes de fin de los trabajos aún no impresos
+        self._pending = deque()  # (instante de liberación, bytes)
+        self._lock = threading.Lock()
+
+    def _release(self, now):
+        while self._pending and self._pending[0][0] <= now:
+            self._pending.popleft()
+        while self._unfinished and self._unfinished[0] <= now:
+            self._unfinished.popleft()
+
+    def schedule_job(self, height_px, paper_width_px, cuts=0):
+        """
+        Encola la impresión de un ticket renderizado y devuelve su registro
+        (largo en mm, tiempo de impresión simulado e instante de fin).
+        """
+        length_mm = height_px * self.print_width_mm / paper_width_px
+        print_time = length_mm / self.speed_mm_s + cuts * self.cut_time
+        with self._lock:
+            now = time.monotonic()
+            self.busy_until = max(now, self.busy_until) + print_time
+            job = {"length_mm": length_mm, "print_time": print_time, "finish": self.busy_until}
+            self.job_count += 1
+            self.total_print_time += print_time
+            self._unfinished.append(self.busy_until)
+        return job
+
+    def on_received(self, nbytes):
+        """Registra bytes ya entregados al parser: quedan en el buffer hasta que termine lo encolado."""
+        with self._lock:
+            now = time.monotonic()
+            self._release(now)
+            self._pending.append((max(now, self.busy_until), nbytes))
+            self.max_queue_bytes = max(self.max_queue_bytes, sum(n for _, n in self._pending))
+
+    def wait_for_space(self, max_bytes, on_log=None, stop_event=None):
+        """
+        Bloquea hasta que haya lugar en el buffer de recepción y devuelve
+        cuántos bytes se pueden leer del socket (como máximo max_bytes).
+        Devuelve 0 si se activa stop_event mientras espera.
+        """
+        stalled = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._release(now)
+                free = self.buffer_size - sum(n for _, n in self._pending)
+                next_release = self._pending[0][0] if self._pending else now
+            if free > 0:
+                return min(max_bytes, free)
+            if not stalled and on_log:
+                on_log(f"[EMU] Buffer de recepción lleno ({self.buffer_size} bytes), esperando al cabezal")
+            stalled = True
+            if stop_event is None:
+                time.sleep(max(0.001, next_release - now))
+            elif stop_event.wait(max(0.001, next_release - now)):
+                return 0
+
+    def stats(self):
+        """Profundidad de cola actual y tiempos de impresión simulados."""
+        with self._lock:
+            now = time.monotonic()
+            self._release(now)
+            return {
+                "queue_bytes": sum(n for _, n in self._pending),
+                "queue_jobs": len(self._unfinished),
+                "max_queue_bytes": self.max_queue_bytes,
+                "jobs": self.job_count,
+                "total_print_time": self.total_print_time,
+                "avg_print_time": self.total_print_time / self.job_count if self.job_count else 0.0,
+            }
+
+
+class TCPServer(threading.Thread):
+    def __init__(self, host, port, on_data_received, on_log, emulation=None, on_connect=None, on_disconnect=None):
+        super().__init__(daemon=True)
+        self.host = host
+        self.port = port  # 0 = puerto libre elegido por el sistema (se actualiza al escuchar)
+        self.on_data_received = on_data_received
+        self.on_log = on_log
+        # Avisos opcionales de conexión/desconexión de cada cliente ("ip:puerto")
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        # Modelo de velocidad de impresión (None = leer tan rápido como lleguen los datos)
+        self.emulation = emulation
+        self.sock = None
+        # Se activa cuando el socket ya escucha (o falló el bind, ver self.error)
+        self.ready = threading.Event()
+        self.error = None
+        self._stop_event = threading.Event()
+        # Conexiones abiertas: socket -> hilo que la atiende
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def run(self):
+        """Levanta el socket TCP y acepta clientes en bucle."""
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.emulation:
+            # El buffer del kernel debe fijarse antes de listen() para que lo hereden los
+            # sockets aceptados y la ventana TCP refleje el buffer de la impresora
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.emulation.buffer_size)
+        try:
+            self.sock.bind((self.host, self.port))
+            self.sock.listen(5)
+            self.port = self.sock.getsockname()[1]
+            self.ready.set()
+            self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] Servidor escuchando en {self.host}:{self.port}")
+            while True:
+                client, addr = self.sock.accept()
+                with self._clients_lock:
+                    if self._stop_event.is_set():
+                        client.close()
+                        break
+                    thread = threading.Thread(target=self.handle_client, args=(client,), daemon=True)
+                    self._clients[client] = thread
+                thread.start()
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self.error = e
+                self.on_log(f"[ERROR] {str(e)}")
+        finally:
+            self.ready.set()
+            if self.sock:
+                self.sock.close()
+
+    def stop(self, timeout=2.0):
+        """
+        Cierra el socket de escucha y las conexiones abiertas, y espera (hasta
+        timeout segundos) a que terminen el hilo del servidor y los de cada cliente.
+        """
+        self._stop_event.set()
+        with self._clients_lock:
+            clients = list(self._clients.items())
+        # shutdown despierta al accept()/recv() bloqueados en Linux; close solo no alcanza
+        for sock in [self.sock] + [client for client, _ in clients]:
+            if sock:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if self.sock:
+            self.sock.close()
+        for thread in [self] + [thread for _, thread in clients]:
+            if thread.is_alive() and thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def handle_client(self, client_sock):
+        """Manejo de cada cliente: recibe datos y los reenvía al parser."""
+        with client_sock:
+            try:
+                client_info = f"{client_sock.getpeername()[0]}:{client_sock.getpeername()[1]}"
+                self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] Conexión establecida con {client_info}")
+                if self.on_connect:
+                    self.on_connect(client_info)
+
+                while True:
+                    recv_size = 4096
+                    if self.emulation:
+                        recv_size = self.emulation.wait_for_space(recv_size, self.on_log, self._stop_event)
+                        if not recv_size:
+                            break
+                    data = client_sock.recv(recv_size)
+                    if self._stop_event.is_set():
+                        # Servidor detenido: lo que llegue ya no se procesa
+                        break
+                    if not data:
+                        self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] Cliente {client_info} cerró la conexión")
+                        break
+
+                    hexdata = " ".join(f"{b:02X}" for b in data)
+                    self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] [⇢] Datos recibidos ({len(data)} bytes)")
+                    self.on_log(f"[HEX] {hexdata}")
+                    self.on_data_received(data, client_info)
+                    if self.emulation:
+                        self.emulation.on_received(len(data))
+
+            except Exception as e:
+                self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] [ERROR] Excepción en cliente {client_info}: {str(e)}")
+            finally:
+                self.on_log(f"[{datetime.now().strftime('%H:%M:%S')}] Cliente {client_info} desconectado")
+                with self._clients_lock:
+                    self._clients.pop(client_sock, None)
+                if self.on_disconnect:
+                    self.on_disconnect(client_info)
+
+
+class TicketRenderer:
+    """
+    Renderiza la lista de elementos de un ticket [(tipo, contenido, estilo), ...]
+    a un PIL.Image en modo "L".
+
+    Los tickets idénticos (mismos elementos, ancho y fuentes) se toman de
+    self.ticket_cache sin volver a dibujarse; cada elemento se dibuja como un
+    segmento independiente que se reutiliza desde self.segment_cache, de modo
+    que encabezados y pies repetidos no se vuelven a generar.
+    """
+
+    def __init__(self, on_log=None):
+        self.on_log = on_log or (lambda message: None)
+        self.ticket_cache = RenderCache(max_entries=128, max_bytes=64 * 1024 * 1024)
+        self.segment_cache = RenderCache(max_entries=2048, max_bytes=32 * 1024 * 1024)
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def render(self, elements, width, padding=10):
+        """Devuelve la imagen del ticket (desde la caché si ya se renderizó antes)."""
+        settings = f"{width}|{padding}|{FONT_REGULAR}|{FONT_BOLD}"
+        digests = [_element_digest(el) for el in elements]
+        ticket_key = hashlib.sha256("|".join([settings] + digests).encode("ascii")).hexdigest()
+
+        with self._lock:
+            image = self.ticket_cache.get(ticket_key)
+            if image is not None:
+                stats = self.ticket_cache.stats()
+                self.on_log(
+                    f"[CACHE] Ticket reutilizado - aciertos {stats['hits']}/{stats['hits'] + stats['misses']} "
+                    f"({stats['hit_rate']:.0%}), segmentos {self.segment_cache.hit_rate:.0%}"
+                )
+                return image
+
+            segments = [
+                self._render_segment(el, f"{settings}|{digest}", width, padding)
+                for el, digest in zip(elements, digests)
+            ]
+            total_height = padding * 2 + sum(seg.height for seg in segments)
+
+            # Creamos la imagen de este ticket (modo “L” = blanco y negro)
+            image = Image.new("L", (width, total_height), 255)
+            y = padding
+            for seg in segments:
+                image.paste(seg, (0, y))
+                y += seg.height
+            self.ticket_cache.put(ticket_key, image)
+            return image
+
+    def _get_font(self, bold, size):
+        """Devuelve la fuente (cacheada) para el estilo y tamaño indicados."""
+        key = (bold, size)
+        if key not in self._fonts:
+            try:
+                font = ImageFont.truetype(FONT_BOLD if bold else FONT_REGULAR, size)
+            except:
+                font = ImageFont.load_default()
+                if not hasattr(font, 'getbbox'):
+                    font.getbbox = lambda t: (0, 0, len(t) * 6, size)
+            self._fonts[key] = font
+        return self._fonts[key]
+
+    def _render_segment(self, el, key, width, padding):
+        """
+        Dibuja un elemento del ticket en su propia franja de ancho `width`
+        (incluye el espacio vertical posterior). Las franjas se cachean bajo `key`.
+        """
+        segment = self.segment_cache.get(key)
+        if segment is not None:
+            return segment
+
+        tipo = el[0]
+        if tipo == "text":
+            text, style = el[1], el[2]
+            font = self._get_font(bool(style.get("bold")), 20 * style["text_size"][0])
+            bbox = font.getbbox(text)
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+
+            # Calcular X según alineación
+            if style["align"] == "center":
+                x = (width - text_width) // 2
+            elif style["align"] == "right":
+                x = width - text_width - padding
+            else:
+                x = padding
+
+            segment = Image.new("L", (width, max(text_height + 10, bbox[3] + 3)), 255)
+            draw = ImageDraw.Draw(segment)
+            draw.text((x, 0), text, font=font, fill=0)
+            if style.get("underline"):
+                draw.line((x, text_height + 2, x + text_width, text_height + 2), fill=0)
+
+        elif tipo in ("qr", "barcode", "image"):
+            if tipo == "qr":
+                # Generar el QR (200×200) sin imprimir nunca el texto “k1Q0”
+                try:
+                    content = qrcode.make(el[1]).resize((200, 200)).convert("L")
+                except Exception as e:
+                    self.on_log(f"[QR ERROR] {e}")
+                    content = Image.new("L", (200, 200), 255)
+            elif tipo == "barcode":
+                content = self._render_barcode(el[1])
+            else:
+                content = el[1]
+            # Si la imagen es más ancha que el ticket, la escalamos
+            if content.width > width:
+                new_height = int(content.height * width / content.width)
+                content = content.resize((width, new_height), Image.LANCZOS)
+            segment = Image.new("L", (width, content.height + 10), 255)
+            segment.paste(content, ((width - content.width) // 2, 0))
+
+        elif tipo == "cut":
+            # Dibujar una línea horizontal para simular el corte
+            segment = Image.new("L", (width, 10), 255)
+            ImageDraw.Draw(segment).line((padding, 2, width - padding, 2), fill=0, width=2)
+
+        elif tipo == "feed":
+            segment = Image.new("L", (width, 30 * el[1]), 255)
+
+        else:
+            segment = Image.new("L", (width, 0), 255)
+
+        self.segment_cache.put(key, segment)
+        return segment
+
+    def _render_barcode(self, data: str) -> Image.Image:
+        """
+        Genera un PIL.Image con un código de barras.
+        """
+        try:
+            CODE128 = barcode.get_barcode_class("code128")
+            code = CODE128(data, writer=ImageWriter())
+            buffer = io.BytesIO()
+            code.write(buffer, {"module_height": 10.0, "font_size": 10})
+            return Image.open(buffer).convert("L")
+        except Exception as e:
+            self.on_log(f"[BARCODE ERROR] {e}")
+            return Image.new("L", (200, 50), 255)
+
+
+class PrintJob:
+    """
+    Trabajo recibido por HeadlessPrinter: los elementos parseados desde la conexión
+    hasta el corte de papel (o hasta que el cliente cerró la conexión). La imagen
+    se renderiza recién la primera vez que se pide.
+    """
+
+    def __init__(self, job_id, elements, connection, renderer, paper_width):
+        self.id = job_id
+        self.elements = elements
+        self.connection = connection
+        self.timestamp = datetime.now()
+        self._renderer = renderer
+        self._paper_width = paper_width
+        self._image = None
+        # Tiempo de impresión simulado (solo con emulación de velocidad)
+        self.print_time = None
+
+    @property
+    def texts(self):
+        """Líneas de texto del ticket, en orden."""
+        return [el[1] for el in self.elements if el[0] == "text"]
+
+    @property
+    def text(self):
+        return "\n".join(self.texts)
+
+    @property
+    def qr_codes(self):
+        return [el[1] for el in self.elements if el[0] == "qr"]
+
+    @property
+    def barcodes(self):
+        return [el[1] for el in self.elements if el[0] == "barcode"]
+
+    @property
+    def image(self):
+        """PIL.Image del ticket renderizado."""
+        if self._image is None:
+            self._image = self._renderer.render(self.elements, self._paper_width)
+        return self._image
+
+    def __repr__(self):
+        return f"<PrintJob #{self.id} {self.connection} {len(self.elements)} elementos>"
+
+
+class HeadlessPrinter:
+    """
+    Simulador embebible sin interfaz gráfica. Escucha en host:port (port=0 elige un
+    puerto libre, ver .port tras start()) y entrega cada trabajo recibido como PrintJob.
+
+        with HeadlessPrinter() as printer:
+            enviar_ticket("127.0.0.1", printer.port)
+            job = printer.wait_for_job()
+            assert "TOTAL" in job.text
+
+    Cada conexión tiene su propio parser y su trabajo en curso, de modo que clientes
+    simultáneos no se mezclan; los gráficos NV y de descarga se comparten, como en
+    una impresora real. Cada instancia tiene sus propios almacenes y cachés, así que
+    pueden convivir muchas en el mismo proceso (por ejemplo con pytest -n).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, paper_width=400, nv_storage_dir=None, emulation=None):
+        self.host = host
+        self.port = port
+        self.emulation = emulation
+        self.logs = deque(maxlen=10000)
+        self.jobs = []
+        self.renderer = TicketRenderer(self.logs.append)
+        # Parser base: guarda la configuración y los gráficos compartidos por todas las conexiones
+        self.parser = ESC_POS_Parser(None, self.logs.append, nv_storage_dir=nv_storage_dir)
+        self.parser.paper_width = paper_width
+        self.server = None
+        self._queue = queue.Queue()
+        # Estado por conexión ("ip:puerto"): parser, elementos pendientes y tiempo simulado
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def start(self, timeout=5.0):
+        """Levanta el servidor TCP y espera a que esté escuchando. Devuelve self."""
+        self.server = TCPServer(
+            self.host, self.port, self._on_data_received, self.logs.append,
+            emulation=self.emulation, on_connect=self._on_connect, on_disconnect=self._on_disconnect
+        )
+        self.server.start()
+        if not self.server.ready.wait(timeout):
+            raise TimeoutError(f"El servidor no quedó escuchando en {self.host}:{self.port}")
+        if self.server.error:
+            raise self.server.error
+        self.port = self.server.port
+        return self
+
+    def stop(self):
+        """Cierra el servidor y las conexiones abiertas (los trabajos recibidos se conservan)."""
+        if self.server:
+            self.server.stop()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def wait_for_job(self, timeout=5.0):
+        """Bloquea hasta el próximo trabajo completo y lo devuelve (TimeoutError si no llega)."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No se recibió ningún trabajo en {timeout} s") from None
+
+    def reset(self):
+        """Descarta trabajos, buffers y logs acumulados (los gráficos NV se conservan)."""
+        with self._lock:
+            for conn in self._connections.values():
+                conn["parser"].buffer.clear()
+                conn["parser"].objects.clear()
+                conn["parser"].state = "NORMAL"
+                conn["pending"] = []
+                conn["print_time"] = 0.0
+            self.jobs.clear()
+            self.logs.clear()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+    def _on_connect(self, connection):
+        parser = ESC_POS_Parser(
+            lambda elements: self._on_render(connection, elements), self.logs.append
+        )
+        parser.paper_width = self.parser.paper_width
+        parser.nv_graphics = self.parser.nv_graphics
+        parser.nv_bit_images = self.parser.nv_bit_images
+        parser.download_graphics = self.parser.download_graphics
+        conn = {"parser": parser, "pending": [], "print_time": 0.0}
+        with self._lock:
+            self._connections[connection] = conn
+        return conn
+
+    def _on_data_received(self, data, connection=None):
+        # Cada conexión se atiende en un único hilo, así que su parser no se comparte
+        conn = self._connections.get(connection) or self._on_connect(connection)
+        conn["parser"].feed(data)
+
+    def _on_disconnect(self, connection):
+        # El parser de la conexión (y los bytes incompletos de su buffer) se descartan
+        with self._lock:
+            conn = self._connections.pop(connection, None)
+            if conn:
+                self._finish_job(connection, conn)
+
+    def _on_render(self, connection, elements):
+        # Se llama desde parser.feed() con los elementos de cada bloque recibido
+        conn = self._connections[connection]
+        if self.emulation and elements:
+            # Igual que en la interfaz: cada bloque ocupa el cabezal apenas se parsea,
+            # así los bytes de un trabajo largo quedan retenidos mientras se imprime
+            chunk = self.renderer.render(elements, self.parser.paper_width)
+            emulated = self.emulation.schedule_job(
+                chunk.height, self.parser.paper_width, sum(1 for el in elements if el[0] == "cut")
+            )
+            conn["print_time"] += emulated["print_time"]
+        with self._lock:
+            for el in elements:
+                conn["pending"].append(el)
+                if el[0] == "cut":
+                    self._finish_job(connection, conn)
+
+    def _finish_job(self, connection, conn):
+        # Se llama con self._lock tomado
+        if not conn["pending"]:
+            return
+        job = PrintJob(len(self.jobs) + 1, conn["pending"], connection, self.renderer, self.parser.paper_width)
+        if self.emulation:
+            job.print_time = conn["print_time"]
+        conn["pending"] = []
+        conn["print_time"] = 0.0
+        self.jobs.append(job)
+        self._queue.put(job)
+
+
+def search_index(argv):
+    """
+    Consulta sin interfaz gráfica sobre un índice JSON Lines guardado por el simulador.
+    Imprime un ticket por línea: ID, fecha, conexión y texto.
+    """
+    parser = argparse.ArgumentParser(description="Buscar tickets en un índice del simulador ESC/POS")
+    parser.add_argument("--buscar", required=True, help="Texto a buscar (todas las palabras, por prefijo)")
+    parser.add_argument("--indice", default=os.environ.get("SIMULADOR_INDEX_FILE"),
+                        help="Archivo de índice JSON Lines (por defecto SIMULADOR_INDEX_FILE)")
+    parser.add_argument("--conexion", help="Filtrar por conexión (IP o IP:puerto)")
+    parser.add_argument("--desde", help="Fecha/hora ISO mínima, p. ej. 2024-05-01T08:00")
+    parser.add_argument("--hasta", help="Fecha/hora ISO máxima")
+    args = parser.parse_args(argv)
+    if not args.indice:
+        parser.error("indica el archivo de índice con --indice o SIMULADOR_INDEX_FILE")
+
+    index = TicketIndex.load(args.indice)
+    try:
+        results = index.search(args.buscar, args.conexion, args.desde, args.hasta)
+    except ValueError as e:
+        parser.error(f"fecha inválida en --desde/--hasta: {e}")
+    for record in results:
+        print(f"#{record['id']}\t{record['timestamp']}\t{record['connection'] or 'local'}\t"
+              + " | ".join(record["texts"]))
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(search_index(sys.argv[1:]))
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Plugin de pytest para usar el simulador ESC/POS sin interfaz gráfica.
+
+Para habilitarlo, en el conftest.py de la suite de pruebas:
+
+    pytest_plugins = ["simulador_pytest"]
+
+Cada prueba que pida el fixture `escpos_printer` recibe un HeadlessPrinter propio
+escuchando en 127.0.0.1 y en un puerto libre (printer.port), por lo que las
+pruebas pueden correr en paralelo (pytest -n) sin pelear por el puerto 9100.
+"""
+
+import pytest
+
+from simulador_core import HeadlessPrinter
+
+
+@pytest.fixture
+def escpos_printer():
+    """Simulador en un puerto efímero, detenido al terminar la prueba."""
+    printer = HeadlessPrinter().start()
+    try:
+        yield printer
+    finally:
+        printer.stop()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del modelo de velocidad de impresión (PrinterEmulation), sin sockets ni Qt."""
+
+import time
+
+import pytest
+
+from simulador_core import PrinterEmulation
+
+
+def test_schedule_job_converts_height_to_mm_and_print_time():
+    emu = PrinterEmulation(speed_mm_s=100, buffer_size=4096, cut_time=0.5, print_width_mm=72)
+    before = time.monotonic()
+    # 800 px sobre un papel de 400 px equivalen a 144 mm de 72 mm de ancho
+    job = emu.schedule_job(800, 400, cuts=2)
+    assert job["length_mm"] == pytest.approx(144)
+    assert job["print_time"] == pytest.approx(1.44 + 2 * 0.5)
+    assert job["finish"] == pytest.approx(before + job["print_time"], abs=0.05)
+
+
+def test_jobs_queue_behind_the_busy_head():
+    emu = PrinterEmulation(speed_mm_s=72, cut_time=0, print_width_mm=72)
+    first = emu.schedule_job(400, 400)  # 72 mm a 72 mm/s = 1 s
+    second = emu.schedule_job(200, 400)
+    assert second["finish"] == pytest.approx(first["finish"] + 0.5)
+
+
+def test_wait_for_space_returns_immediately_while_idle():
+    emu = PrinterEmulation(buffer_size=100)
+    started = time.monotonic()
+    assert emu.wait_for_space(4096) == 100
+    assert emu.wait_for_space(10) == 10
+    assert time.monotonic() - started < 0.05
+
+
+def test_wait_for_space_blocks_until_the_head_prints_the_queued_bytes():
+    emu = PrinterEmulation(speed_mm_s=72, buffer_size=100, cut_time=0, print_width_mm=72)
+    logs = []
+    emu.schedule_job(40, 400)  # 7.2 mm a 72 mm/s = 0.1 s
+    emu.on_received(100)  # buffer lleno hasta que termine ese trabajo
+
+    started = time.monotonic()
+    assert emu.wait_for_space(4096, logs.append) == 100
+    elapsed = time.monotonic() - started
+    assert 0.07 <= elapsed < 1.0
+    assert len(logs) == 1 and "Buffer de recepción lleno" in logs[0]
+
+
+def test_stats_report_queue_depth_and_totals():
+    emu = PrinterEmulation(speed_mm_s=720, buffer_size=4096, cut_time=0, print_width_mm=72)
+    emu.schedule_job(400, 400)  # 0.1 s
+    emu.on_received(300)
+    emu.schedule_job(400, 400)  # termina 0.2 s después de empezar
+    emu.on_received(200)
+
+    stats = emu.stats()
+    assert (stats["queue_jobs"], stats["queue_bytes"], stats["jobs"]) == (2, 500, 2)
+    assert stats["total_print_time"] == pytest.approx(0.2)
+    assert stats["avg_print_time"] == pytest.approx(0.1)
+
+    time.sleep(0.25)
+    stats = emu.stats()
+    assert (stats["queue_jobs"], stats["queue_bytes"]) == (0, 0)
+    assert stats["max_queue_bytes"] == 500 and stats["jobs"] == 2
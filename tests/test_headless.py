@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de HeadlessPrinter y del fixture escpos_printer (servidor TCP real en puerto efímero)."""
+
+import socket
+import sys
+import time
+
+import pytest
+
+from simulador_core import HeadlessPrinter, PrinterEmulation
+
+CUT = b"\x1dV\x00"
+
+
+def qr(data):
+    """QR en el formato que reconoce el parser: GS ( k, 4 bytes de cabecera, largo y datos."""
+    return b"\x1d(k\x00\x00\x31\x50" + bytes([len(data)]) + data + b"\n"
+
+
+def send(port, data):
+    with socket.create_connection(("127.0.0.1", port)) as conn:
+        conn.sendall(data)
+
+
+def test_runs_without_qt():
+    assert "PyQt5" not in sys.modules
+
+
+def test_fixture_listens_on_ephemeral_port(escpos_printer):
+    assert escpos_printer.port not in (0, 9100)
+    assert escpos_printer.address == ("127.0.0.1", escpos_printer.port)
+
+
+def test_receives_texts_and_qr(escpos_printer):
+    send(escpos_printer.port, b"\x1b@Orden #4521\nTOTAL 63\n" + qr(b"https://x/4521") + CUT)
+    job = escpos_printer.wait_for_job()
+    assert job.texts == ["Orden #4521", "TOTAL 63"]
+    assert job.qr_codes == ["https://x/4521"]
+    assert job.connection.startswith("127.0.0.1:")
+    assert job.image.width == 400 and job.image.height > 200
+
+
+def test_jobs_split_at_cut_and_at_disconnect(escpos_printer):
+    send(escpos_printer.port, b"uno\n" + CUT + b"dos\n")
+    assert escpos_printer.wait_for_job().texts == ["uno"]
+    # "dos" no tiene corte: el trabajo termina al cerrarse la conexión
+    assert escpos_printer.wait_for_job().texts == ["dos"]
+    assert [job.id for job in escpos_printer.jobs] == [1, 2]
+
+
+def test_interleaved_connections_keep_separate_jobs(escpos_printer):
+    a = socket.create_connection(escpos_printer.address)
+    b = socket.create_connection(escpos_printer.address)
+    try:
+        a.sendall(b"A1\n")
+        b.sendall(b"B1\n")
+        time.sleep(0.1)
+        a.sendall(b"A2\n" + CUT)
+        b.sendall(b"B2\n" + CUT)
+        jobs = [escpos_printer.wait_for_job(), escpos_printer.wait_for_job()]
+    finally:
+        a.close()
+        b.close()
+    assert sorted(job.texts for job in jobs) == [["A1", "A2"], ["B1", "B2"]]
+    assert len({job.connection for job in jobs}) == 2
+
+
+def test_incomplete_command_does_not_leak_into_next_connection(escpos_printer):
+    send(escpos_printer.port, b"uno\n\x1d")
+    assert escpos_printer.wait_for_job().texts == ["uno"]
+    send(escpos_printer.port, b"dos\n" + CUT)
+    assert escpos_printer.wait_for_job().texts == ["dos"]
+
+
+def test_emulation_holds_back_a_long_job():
+    emulation = PrinterEmulation(speed_mm_s=10.0, buffer_size=4096, cut_time=0.0)
+    ticket = b"".join(b"linea %05d de relleno\n" % n for n in range(5000)) + CUT
+    with HeadlessPrinter(emulation=emulation) as printer:
+        conn = socket.create_connection(printer.address)
+        conn.settimeout(1.0)
+        try:
+            # Los buffers del kernel pueden aceptar todo el envío; lo que importa es
+            # que el simulador deje de leer cuando se llena su buffer emulado
+            conn.sendall(ticket)
+        except socket.timeout:
+            pass
+        deadline = time.monotonic() + 5.0
+        while not emulation.stats()["queue_bytes"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.3)
+        try:
+            assert emulation.stats()["queue_bytes"] == 4096
+            assert emulation.total_print_time > 60
+            assert printer.jobs == []
+        finally:
+            conn.close()
+
+
+def test_wait_for_job_timeout(escpos_printer):
+    with pytest.raises(TimeoutError):
+        escpos_printer.wait_for_job(timeout=0.2)
+
+
+def test_parallel_instances_use_distinct_ports(escpos_printer):
+    with HeadlessPrinter() as other:
+        assert other.port != escpos_printer.port
+        send(other.port, b"otro\n" + CUT)
+        assert other.wait_for_job().texts == ["otro"]
+    with pytest.raises(TimeoutError):
+        escpos_printer.wait_for_job(timeout=0.2)
+
+
+def test_stop_closes_open_connections():
+    printer = HeadlessPrinter().start()
+    conn = socket.create_connection(printer.address)
+    conn.sendall(b"antes\n" + CUT)
+    assert printer.wait_for_job().texts == ["antes"]
+
+    printer.stop()
+    try:
+        conn.sendall(b"despues\n" + CUT)
+        time.sleep(0.2)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+    assert [job.texts for job in printer.jobs] == [["antes"]]
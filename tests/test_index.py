@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del índice de búsqueda de tickets y de la consulta sin interfaz (--buscar)."""
+
+from datetime import datetime
+
+import pytest
+
+from simulador_core import TicketIndex, search_index
+
+
+def text(value):
+    return ("text", value, {})
+
+
+def test_search_uses_word_prefixes_and_requires_all_words():
+    index = TicketIndex()
+    index.add([text("Orden #4521"), text("Total 63")], "10.0.0.1:5000")
+    index.add([text("Orden #4522"), ("qr", "https://x/4522"), ("barcode", "779001")], "10.0.0.2:5000")
+
+    assert [r["id"] for r in index.search("orden 4521")] == [1]
+    assert [r["id"] for r in index.search("orden 452")] == [1, 2]
+    assert [r["id"] for r in index.search("779")] == [2]
+    assert index.search("orden 9999") == []
+    assert [r["id"] for r in index.search("orden", connection="10.0.0.2")] == [2]
+
+
+def test_date_bounds():
+    index = TicketIndex()
+    index.add([text("ayer")], timestamp=datetime(2024, 5, 1, 18, 30))
+    index.add([text("hoy")], timestamp=datetime(2024, 5, 2, 9, 0))
+
+    assert len(index.search("hoy", since="2024-05-02")) == 1
+    # Una fecha sin hora como límite superior abarca todo el día
+    assert len(index.search("ayer", until="2024-05-01")) == 1
+    assert index.search("ayer", until="2024-05-01T12:00") == []
+    with pytest.raises(ValueError):
+        index.search("ayer", until="mañana")
+
+
+def test_index_file_round_trip_keeps_ids_unique_across_sessions(tmp_path):
+    path = str(tmp_path / "tickets.jsonl")
+    first = TicketIndex(path)
+    assert first.add([text("ORDER 4521")])["id"] == 1
+    first.clear()  # reset de la interfaz: la numeración continúa
+    assert first.add([text("TEA")])["id"] == 2
+
+    second = TicketIndex(path)  # nueva sesión
+    assert second.add([text("COFFEE")])["id"] == 3
+
+    loaded = TicketIndex.load(path)
+    assert [r["texts"] for r in loaded.search("4521")] == [["ORDER 4521"]]
+    assert [r["id"] for r in loaded.search("coffee")] == [3]
+
+
+def test_search_index_command(tmp_path, capsys):
+    path = str(tmp_path / "tickets.jsonl")
+    TicketIndex(path).add([text("Orden #4521")], "10.0.0.1:5000")
+
+    assert search_index(["--buscar", "4521", "--indice", path]) == 0
+    out = capsys.readouterr().out
+    assert out.startswith("#1\t") and "10.0.0.1:5000" in out and "Orden #4521" in out
+    assert search_index(["--buscar", "cafe", "--indice", path]) == 1
+
+
+def test_connection_filter_matches_exact_ip_or_ip_and_port():
+    index = TicketIndex()
+    index.add([text("orden")], "10.0.0.1:5000")
+    index.add([text("orden")], "10.0.0.10:5000")
+    index.add([text("orden")], "10.0.0.1:6000")
+
+    assert [r["id"] for r in index.search("orden", connection="10.0.0.1")] == [1, 3]
+    assert [r["id"] for r in index.search("orden", connection="10.0.0.1:5000")] == [1]
+    assert [r["id"] for r in index.search("orden", connection="10.0.0.10")] == [2]
+
+
+def test_bounds_with_timezone_are_rejected(tmp_path):
+    index = TicketIndex()
+    index.add([text("orden")])
+    with pytest.raises(ValueError):
+        index.search("orden", since="2024-05-01T00:00+00:00")
+
+    path = str(tmp_path / "tickets.jsonl")
+    TicketIndex(path).add([text("orden")])
+    with pytest.raises(SystemExit) as exc:
+        search_index(["--buscar", "orden", "--indice", path, "--desde", "2024-05-01T00:00+00:00"])
+    assert exc.value.code == 2
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Pruebas del parser ESC/POS: gráficos NV/descarga, FS q/FS p, ESC * y comandos partidos."""
+
+from simulador_core import ESC_POS_Parser, NVGraphicsStore
+
+
+def make_parser(**kwargs):
+    rendered, logs = [], []
+    parser = ESC_POS_Parser(lambda objects: rendered.append(list(objects)), logs.append, **kwargs)
+    return parser, rendered, logs
+
+
+def gs_l(params):
+    """Arma un comando GS ( L pL pH con los parámetros dados."""
+    return b"\x1d(L" + len(params).to_bytes(2, "little") + bytes(params)
+
+
+def define_nv_raster(key, width, height, data, fn=67):
+    return gs_l([48, fn, 48, ord(key[0]), ord(key[1]), 1, width, 0, height, 0, 49] + list(data))
+
+
+def print_nv(key, fn=69, scale=(1, 1)):
+    return gs_l([48, fn, ord(key[0]), ord(key[1]), scale[0], scale[1]])
+
+
+def row(img, y):
+    return [img.getpixel((x, y)) for x in range(img.width)]
+
+
+def test_nv_raster_define_and_print_by_key():
+    parser, rendered, _ = make_parser()
+    parser.feed(define_nv_raster("A1", 16, 2, [0xFF, 0x00, 0x0F, 0xF0]))
+    assert rendered == []  # definir no imprime nada
+    assert "A1" in parser.nv_graphics
+
+    parser.feed(print_nv("A1") + b"hola\n")
+    (img_el, text_el), = rendered
+    img = img_el[1]
+    assert img.size == (16, 2)
+    assert row(img, 0) == [0] * 8 + [255] * 8
+    assert row(img, 1) == [255] * 4 + [0] * 8 + [255] * 4
+    assert text_el[1] == "hola"
+
+    # Imprimir otra vez devuelve la misma imagen ya decodificada
+    parser.feed(print_nv("A1"))
+    assert rendered[-1][0][1] is img
+
+
+def test_nv_column_format_and_scaling():
+    parser, rendered, _ = make_parser()
+    # 2 columnas de 8 puntos: la primera solo con el punto superior, la segunda llena
+    parser.feed(define_nv_raster("B2", 2, 8, [0x80, 0xFF], fn=68))
+    parser.feed(print_nv("B2", scale=(2, 2)))
+    img = rendered[-1][0][1]
+    assert img.size == (4, 16)
+    assert row(img, 0) == [0, 0, 0, 0]
+    assert row(img, 15) == [255, 255, 0, 0]
+
+
+def test_download_graphics_and_delete():
+    parser, rendered, logs = make_parser()
+    parser.feed(define_nv_raster("D1", 8, 1, [0xAA], fn=83))
+    assert "D1" in parser.download_graphics and "D1" not in parser.nv_graphics
+    parser.feed(print_nv("D1", fn=85))
+    assert row(rendered[-1][0][1], 0) == [0, 255] * 4
+
+    parser.feed(gs_l([48, 82, ord("D"), ord("1")]))
+    assert "D1" not in parser.download_graphics
+    parser.feed(print_nv("D1", fn=85))
+    assert any("no definido" in line for line in logs)
+
+
+def test_nv_graphics_persist_across_instances(tmp_path):
+    parser, _, _ = make_parser(nv_storage_dir=str(tmp_path))
+    parser.feed(define_nv_raster("LG", 8, 1, [0xF0]))
+
+    restarted, rendered, _ = make_parser(nv_storage_dir=str(tmp_path))
+    assert restarted.nv_graphics.keys() == ["LG"]
+    restarted.feed(print_nv("LG"))
+    assert row(rendered[-1][0][1], 0) == [0] * 4 + [255] * 4
+
+    restarted.feed(gs_l([48, 65, 67, 76, 82]))  # borrar todos ("CLR")
+    assert len(NVGraphicsStore(str(tmp_path / "gs_l"))) == 0
+
+
+def test_fs_q_defines_bit_images_and_fs_p_prints_them():
+    parser, rendered, _ = make_parser()
+    # FS q con una imagen de 1x1 (8x8 puntos), formato columna: solo el punto (0, 0)
+    parser.feed(b"\x1cq\x01\x01\x00\x01\x00" + bytes([0x80] + [0] * 7))
+    parser.feed(b"\x1cp\x01\x00")
+    img = rendered[-1][0][1]
+    assert img.size == (8, 8)
+    assert img.getpixel((0, 0)) == 0 and img.getpixel((1, 0)) == 255
+
+    parser.feed(b"\x1cp\x01\x03")  # cuádruple
+    assert rendered[-1][0][1].size == (16, 16)
+
+
+def test_esc_star_bands_are_merged_and_survive_split_chunks():
+    parser, rendered, logs = make_parser()
+    parser.feed(b"\x1b*\x01\x03")  # cabecera sin datos todavía
+    parser.feed(b"\x00\x80\x01\xff\n\x1b*\x01\x03\x00\x01\x02\x03\n")
+    (el,), = rendered
+    img = el[1]
+    assert el[2] == "bit_image"
+    assert img.size == (3, 16)
+    assert [img.getpixel((x, 0)) for x in range(3)] == [0, 255, 0]
+    assert [img.getpixel((x, 7)) for x in range(3)] == [255, 0, 0]
+    assert logs[0].split()[3:] == ["1B", "2A", "01", "03", "00"]
+
+
+def test_esc_star_single_density_doubles_width():
+    parser, rendered, _ = make_parser()
+    parser.feed(b"\x1b*\x00\x02\x00\xff\x00\n")
+    assert rendered[-1][0][1].size == (4, 8)
+
+
+def test_gs_command_split_after_gs_paren_is_not_printed_as_text():
+    parser, rendered, _ = make_parser()
+    parser.feed(b"\x1d(")
+    parser.feed(b"L\x02\x000 2TEXT\n")
+    assert [el[1] for el in rendered[-1] if el[0] == "text"] == ["2TEXT"]
+
+
+def test_gs_v_0_raster_image():
+    parser, rendered, _ = make_parser()
+    parser.feed(b"\x1dv0\x00\x01\x00\x02\x00\x80\x01")
+    img = rendered[-1][0][1]
+    assert img.size == (8, 2)
+    assert img.getpixel((0, 0)) == 0 and img.getpixel((1, 0)) == 255 and img.getpixel((7, 1)) == 0
+
+
+def test_gs_v_0_header_split_across_chunks():
+    parser, rendered, _ = make_parser()
+    parser.feed(b"\x1dv0\x00\x01")
+    parser.feed(b"\x00\x02\x00\x80\x01")
+    (el,), = rendered
+    assert el[0] == "image" and el[1].size == (8, 2)
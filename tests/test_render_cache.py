@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de la caché de render (RenderCache) y de la reutilización en TicketRenderer."""
+
+from PIL import Image
+
+from simulador_core import RenderCache, TicketRenderer
+
+STYLE = {"bold": False, "underline": False, "align": "left", "text_size": (1, 1)}
+
+
+def img(size=10):
+    return Image.new("L", (size, size), 255)
+
+
+def text(value):
+    return ("text", value, dict(STYLE))
+
+
+def test_lru_eviction_by_entry_count():
+    cache = RenderCache(max_entries=2, max_bytes=10 ** 6)
+    cache.put("a", img())
+    cache.put("b", img())
+    assert cache.get("a") is not None  # "a" pasa a ser la más reciente
+    cache.put("c", img())
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert len(cache) == 2 and cache.evictions == 1
+
+
+def test_lru_eviction_by_bytes():
+    cache = RenderCache(max_entries=100, max_bytes=250)  # cada imagen 10x10 "L" = 100 bytes
+    cache.put("a", img())
+    cache.put("b", img())
+    assert cache.size_bytes == 200
+    cache.put("c", img())
+    assert cache.get("a") is None
+    assert cache.size_bytes == 200 and cache.evictions == 1
+
+    cache.put("b", img(5))  # reemplazar una entrada ajusta el tamaño
+    assert cache.size_bytes == 125
+
+
+def test_hit_and_miss_counting():
+    cache = RenderCache()
+    assert cache.hit_rate == 0.0
+    cache.put("a", img())
+    cache.get("a")
+    cache.get("a")
+    cache.get("x")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert cache.hit_rate == stats["hit_rate"] == 2 / 3
+
+    cache.clear()
+    assert len(cache) == 0 and cache.size_bytes == 0 and cache.hits == 2
+
+
+def test_identical_ticket_is_reused():
+    renderer = TicketRenderer()
+    elements = [text("TIENDA"), text("Total 10"), ("cut", None)]
+    first = renderer.render(elements, 400)
+    again = renderer.render([text("TIENDA"), text("Total 10"), ("cut", None)], 400)
+    assert again is first
+    assert renderer.ticket_cache.hits == 1
+
+
+def test_ticket_not_reused_when_width_or_content_differs():
+    renderer = TicketRenderer()
+    base = renderer.render([text("TIENDA")], 400)
+    wider = renderer.render([text("TIENDA")], 500)
+    other = renderer.render([text("OTRA")], 400)
+    bold = renderer.render([("text", "TIENDA", dict(STYLE, bold=True))], 400)
+    assert wider is not base and wider.width == 500
+    assert other is not base and bold is not base
+    assert renderer.ticket_cache.hits == 0 and renderer.ticket_cache.misses == 4
+
+
+def test_segments_are_reused_across_tickets():
+    renderer = TicketRenderer()
+    header = [text("TIENDA"), text("Calle 1"), ("qr", "https://x")]
+    renderer.render(header + [text("Orden 1")], 400)
+    hits = renderer.segment_cache.hits
+    renderer.render(header + [text("Orden 2")], 400)
+    assert renderer.segment_cache.hits == hits + len(header)
+    assert renderer.segment_cache.misses == len(header) + 2
+
+
+def test_ticket_height_fits_rendered_segments():
+    renderer = TicketRenderer()
+    ticket = renderer.render([text("Hola"), ("barcode", "12345"), ("cut", None)], 400)
+    # El código de barras completo entra en el ticket (antes se reservaban 50 px y se recortaba)
+    barcode_height = renderer._render_barcode("12345").height
+    assert ticket.height >= 20 + barcode_height + 10